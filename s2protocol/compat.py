@@ -1,9 +1,14 @@
 import sys
 import io
 
-__all__ = 'PY3', 'byte_to_int', 'get_stream'
+__all__ = 'PY3', 'byte_to_int', 'bytes_to_str', 'get_stream', 'imap'
 PY3 = sys.version_info.major == 3
 
+if PY3:
+    imap = map
+else:
+    from itertools import imap
+
 
 def byte_to_int(x):
     if PY3 and isinstance(x, (bytes, int)):
@@ -12,6 +17,13 @@ def byte_to_int(x):
         return ord(x)
 
 
+def bytes_to_str(x):
+    if PY3:
+        return x.decode('ISO-8859-1')
+    else:
+        return x
+
+
 def get_stream():
     if PY3:
         cls = io.StringIO
@@ -4,44 +4,66 @@ from __future__ import print_function
 import argparse
 import binascii
 import cProfile
+import io
 import json
 import pprint
 import pstats
-import re
 import sys
+from collections import defaultdict, deque
 
 from mpyq import MPQArchive
 
-from s2protocol.versions import build, list_all, latest
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from s2protocol.versions import build, list_builds, latest
 from s2protocol.diff import diff
-from s2protocol.compat import get_stream
+from s2protocol.compat import PY3, bytes_to_str, get_stream, imap
 import s2protocol.attributes as _attr
 
 __all__ = (
     'EventFilter', 'JSONOutputFilter', 'NDJSONOutputFilter',
     'PrettyPrintFilter', 'StatCollectionFilter', 'TypeDumpFilter',
-    'cache_handle_uri', 'convert_fourcc', 'json_dump', 'main',
+    'binary_stdout', 'cache_handle_uri', 'chain_filters', 'check_contents',
+    'convert_fourcc', 'drain_events', 'json_dump', 'main',
     'process_details_data', 'process_init_data', 'process_scope_attributes',
     'read_contents',
 )
 
+# URIs already built by cache_handle_uri(), keyed on the raw handle
+_CACHE_HANDLE_URIS_MAX = 512
+_cache_handle_uris = {}
 
-def json_dump(obj, indent=None):
-    def dispatch(o):
-        # Find all bytes(str in Python2) to decode with ISO-8850-1
-        if isinstance(o, dict):
-            return {k: dispatch(v) for k, v in o.items()}
-        elif isinstance(o, list):
-            return [dispatch(v) for v in o]
-        elif isinstance(o, bytes):
-            return o.decode('ISO-8859-1')
-        else:
-            return o
 
-    return json.dumps(dispatch(obj), indent=indent)
+def _decode_bytes(o):
+    """ Decode bytes (str in Python2) with ISO-8859-1 for JSON output """
+    if isinstance(o, bytes):
+        return o.decode('ISO-8859-1')
+    raise TypeError('Object of type {} is not JSON serializable'.format(
+        type(o).__name__))
+
+
+class _ReplayJSONEncoder(json.JSONEncoder):
+    """ JSON encoder that decodes bytes (str in Python2) with ISO-8859-1 """
+    def __init__(self, **kwargs):
+        if not PY3:
+            # Python2 json decodes str itself and never calls default()
+            kwargs['encoding'] = 'ISO-8859-1'
+        json.JSONEncoder.__init__(self, **kwargs)
+
+    def default(self, o):
+        return _decode_bytes(o)
+
+
+def json_dump(obj, indent=None):
+    return json.dumps(obj, indent=indent, cls=_ReplayJSONEncoder)
 
 
 class EventFilter(object):
+    __slots__ = ()
+
     def process(self, event):
         """ Called for each event in the replay stream """
         return event
@@ -51,72 +73,160 @@ class EventFilter(object):
         pass
 
 
+class _TextStreamWriter(object):
+    """ Byte stream over a text stream, decoding each write as UTF-8 """
+    __slots__ = ('_write',)
+
+    def __init__(self, stream):
+        self._write = stream.write
+
+    def write(self, data):
+        return self._write(data.decode('utf-8'))
+
+
+def _bytes_writer(output):
+    """
+    Return a write function taking bytes for output, a text or byte stream.
+    """
+    # Python2 files have an encoding but take bytes
+    if (isinstance(output, io.TextIOBase) or
+            (PY3 and hasattr(output, 'encoding'))):
+        return _TextStreamWriter(output).write
+    return output.write
+
+
 class JSONOutputFilter(EventFilter):
     """ Added as a filter will format the event into JSON """
+    __slots__ = ('_output', '_write', '_encode')
+
     def __init__(self, output):
         self._output = output
+        self._write = _bytes_writer(output)
+        self._encode = _ReplayJSONEncoder(indent=4).encode
 
     def process(self, event):
-        print(json_dump(event, indent=4), file=self._output)
+        # The encoder escapes non-ASCII, so the text is plain ASCII
+        self._write(self._encode(event).encode('ascii') + b'\n')
         return event
 
 
 class NDJSONOutputFilter(EventFilter):
-    """ Added as a filter will format the event into NDJSON """
+    """
+    Added as a filter will format the event into NDJSON
+
+    Events are encoded with orjson when it is installed. orjson writes NaN
+    and Infinity floats as null where json writes NaN and Infinity, and may
+    spell other floats differently (1e16 rather than 1e+16). Decoded replay
+    events hold no floats; only replay.gamemetadata.json can.
+    """
+    __slots__ = ('_output', '_write', '_json_encode', '_ascii_encode',
+                 '_encode')
+
     def __init__(self, output):
         self._output = output
+        self._write = _bytes_writer(output)
+        # Without indent, encode() takes the C accelerated one-shot path,
+        # which is faster than chaining the pure Python iterencode chunks.
+        # The format matches orjson so every line looks the same.
+        self._json_encode = _ReplayJSONEncoder(separators=(',', ':'),
+                                               ensure_ascii=False).encode
+        self._ascii_encode = _ReplayJSONEncoder(separators=(',', ':')).encode
+        if orjson is not None:
+            self._encode = self._orjson_encode
+        else:
+            self._encode = self._stdlib_encode
+
+    def _stdlib_encode(self, event):
+        try:
+            return (self._json_encode(event) + '\n').encode('utf-8')
+        except UnicodeEncodeError:
+            # Lone surrogates such as json.loads('"\\ud800"') have no UTF-8
+            # form, so this event escapes all of its non-ASCII text
+            return (self._ascii_encode(event) + '\n').encode('ascii')
+
+    def _orjson_encode(self, event):
+        try:
+            return orjson.dumps(event, default=_decode_bytes,
+                                option=orjson.OPT_NON_STR_KEYS |
+                                orjson.OPT_APPEND_NEWLINE)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which only json handles
+            return self._stdlib_encode(event)
 
     def process(self, event):
-        print(json_dump(event), file=self._output)
+        self._write(self._encode(event))
         return event
 
 
 class PrettyPrintFilter(EventFilter):
     """ Add as a filter will send objects to stdout """
+    __slots__ = ('_output', '_pprint')
+
     def __init__(self, output):
         self._output = output
+        self._pprint = pprint.PrettyPrinter(stream=output).pprint
 
     def process(self, event):
-        pprint.pprint(event, stream=self._output)
+        self._pprint(event)
         return event
 
 
 class TypeDumpFilter(EventFilter):
     """ Add as a filter to convert events into type information """
+    __slots__ = ()
+
     def process(self, event):
-        def recurse_into(value):
-            if type(value) is list:
-                decoded = []
-                for item in value:
-                    decoded.append(recurse_into(item))
-                return decoded
-            elif type(value) is dict:
+        def convert(value):
+            # Containers are copied empty and queued, leaves become type pairs
+            if isinstance(value, dict):
                 decoded = {}
-                for key, inner_value in value.items():
-                    decoded[key] = recurse_into(inner_value)
-                return decoded
-            return (type(value).__name__, value)
-        return recurse_into(event)
-    
+            elif isinstance(value, list):
+                decoded = [None] * len(value)
+            else:
+                return (type(value).__name__, value)
+            pending.append((value, decoded))
+            return decoded
+
+        pending = []
+        decoded_event = convert(event)
+        while pending:
+            value, decoded = pending.pop()
+            items = value.items() if isinstance(value, dict) else enumerate(value)
+            for key, inner_value in items:
+                decoded[key] = convert(inner_value)
+        return decoded_event
+
 
 class StatCollectionFilter(EventFilter):
     """ Add as a filter to collect stats on events """
+    __slots__ = ('_counts', '_bits')
+
     def __init__(self):
-        self._event_stats = {}
+        self._counts = defaultdict(int)
+        self._bits = defaultdict(int)
 
     def process(self, event):
         # update stats
-        if '_event' in event and '_bits' in event:
-            stat = self._event_stats.get(event['_event'], [0, 0])
-            stat[0] += 1  # count of events
-            stat[1] += event['_bits']  # count of bits
-            self._event_stats[event['_event']] = stat
+        name = event.get('_event')
+        bits = event.get('_bits')
+        if name is not None and bits is not None:
+            self._counts[name] += 1  # count of events
+            self._bits[name] += bits  # count of bits
         return event
 
     def finish(self):
         print('Name, Count, Bits')
-        for name, stat in sorted(self._event_stats.items(), key=lambda x: x[1][1]):
-            print('"{:s}", {:d}, {:d}'.format(name, stat[0], stat[1] / 8))
+        counts = self._counts
+        bits = self._bits
+        for name in sorted(bits, key=bits.__getitem__):
+            print('"{:s}", {:d}, {:d}'.format(name, counts[name], bits[name] // 8))
+
+
+def _strip_fourcc(fourcc):
+    """
+    Remove the NUL padding from a raw 4 byte fourcc.
+    """
+    return fourcc.replace(b'\x00', b'')
 
 
 def convert_fourcc(fourcc_hex):
@@ -124,30 +234,35 @@ def convert_fourcc(fourcc_hex):
     Convert a hexidecimal [fourcc](https://en.wikipedia.org/wiki/FourCC) 
     represpentation to a string.
     """
-    s = []
-    for i in range(0, 7, 2):
-        n = int(fourcc_hex[i:i+2], 16)
-        if n is not 0:
-            s.append(chr(n))
-    return ''.join(s)
+    return bytes_to_str(_strip_fourcc(binascii.a2b_hex(fourcc_hex[0:8])))
 
 
 def cache_handle_uri(handle):
     """
     Convert a 'cache handle' from a binary string to a string URI
     """
-    handle_hex = binascii.b2a_hex(handle).decode()
-    purpose = convert_fourcc(handle_hex[0:8]) # first 4 bytes
-    region = convert_fourcc(handle_hex[8:16]) # next 4 bytes
-    content_hash = handle_hex[16:]
-  
-    uri = ''.join([
-        'http://',
-        region.lower(),
-        '.depot.battle.net:1119/',
-        content_hash.lower(), '.',
-        purpose.lower()
+    try:
+        return _cache_handle_uris[handle]
+    except KeyError:
+        pass
+
+    purpose = _strip_fourcc(handle[0:4]).lower() # first 4 bytes
+    region = _strip_fourcc(handle[4:8]).lower() # next 4 bytes
+    content_hash = binascii.b2a_hex(handle[8:])
+
+    uri = b''.join([
+        b'http://',
+        region,
+        b'.depot.battle.net:1119/',
+        content_hash, b'.',
+        purpose
       ])
+    uri = bytes_to_str(uri)
+
+    # Many replays reference the same map and mod handles
+    if len(_cache_handle_uris) >= _CACHE_HANDLE_URIS_MAX:
+        _cache_handle_uris.clear()
+    _cache_handle_uris[handle] = uri
     return uri
 
 
@@ -155,10 +270,8 @@ def process_details_data(details):
     """
     Take details and convert cache handles to HTTP references.
     """
-    translated_handles = []
-    for handle in details['m_cacheHandles']:
-        translated_handles.append(cache_handle_uri(handle))
-    details['m_cacheHandles'] = translated_handles
+    uri = cache_handle_uri
+    details['m_cacheHandles'] = [uri(h) for h in details['m_cacheHandles']]
     return details
 
 
@@ -166,10 +279,9 @@ def process_init_data(initdata):
     """
     Take replay init data and convert cache handles to HTTP references.
     """
-    translated_handles = []
-    for handle in initdata['m_syncLobbyState']['m_gameDescription']['m_cacheHandles']:
-        translated_handles.append(cache_handle_uri(handle))
-    initdata['m_syncLobbyState']['m_gameDescription']['m_cacheHandles'] = translated_handles
+    game_description = initdata['m_syncLobbyState']['m_gameDescription']
+    uri = cache_handle_uri
+    game_description['m_cacheHandles'] = [uri(h) for h in game_description['m_cacheHandles']]
     return initdata
 
 
@@ -197,6 +309,78 @@ def process_scope_attributes(all_scopes, event_fn):
         event_fn(scope_doc)
 
 
+def chain_filters(filters):
+    """
+    Build one callable that passes an event through each filter in order.
+    The chain is unrolled for up to the three filters the CLI can stack.
+    """
+    processes = tuple(f.process for f in filters)
+    if not processes:
+        def process_event(event):
+            return event
+    elif len(processes) == 1:
+        process_event = processes[0]
+    elif len(processes) == 2:
+        def process_event(event, f0=processes[0], f1=processes[1]):
+            return f1(f0(event))
+    elif len(processes) == 3:
+        def process_event(event, f0=processes[0], f1=processes[1],
+                          f2=processes[2]):
+            return f2(f1(f0(event)))
+    else:
+        def process_event(event, processes=processes):
+            for process in processes:
+                event = process(event)
+            return event
+    return process_event
+
+
+def drain_events(events, process_event):
+    """
+    Run process_event over an event stream without keeping the results.
+    """
+    deque(imap(process_event, events), maxlen=0)
+
+
+class _FlushingWriter(object):
+    """ Byte stream that flushes the buffered stream after every write """
+    __slots__ = ('_write', '_flush')
+
+    def __init__(self, stream):
+        self._write = stream.write
+        self._flush = stream.flush
+
+    def write(self, data):
+        written = self._write(data)
+        self._flush()
+        return written
+
+
+def binary_stdout():
+    """
+    Return stdout as a stream that takes bytes, bypassing the text layer.
+    """
+    if not PY3:
+        # Python2 file objects already take bytes
+        return sys.stdout
+    stdout = getattr(sys.stdout, 'buffer', None)
+    if stdout is None:
+        # stdout was swapped for a text only stream such as io.StringIO
+        return _TextStreamWriter(sys.stdout)
+    sys.stdout.flush()
+    if sys.stdout.isatty():
+        # Each write is a whole event, flushing it keeps events appearing
+        # as they are decoded, like the line buffered text layer does
+        return _FlushingWriter(stdout)
+    return stdout
+
+
+def check_contents(archive, content):
+    if archive.get_hash_table_entry(content) is None:
+        print('Error: Archive missing {}'.format(content))
+        sys.exit(1)
+
+
 def read_contents(archive, content):
     contents = archive.read_file(content)
     if not contents:
@@ -263,15 +447,10 @@ def main():
 
     # List all protocol versions
     if args.versions:
-        files = list_all()
-        pattern = re.compile('^protocol([0-9]+).py$')
-        captured = []
-        for f in files:
-            captured.append(pattern.match(f).group(1))
-            if len(captured) == 8:
-                print(captured[0:8])
-                captured = []
-        print(captured)
+        versions = [str(v) for v in list_builds()]
+        write = sys.stdout.write
+        for i in range(0, len(versions), 8):
+            write('\t'.join(versions[i:i + 8]) + '\n')
         return
 
     # Diff two protocols
@@ -294,9 +473,9 @@ def main():
     filters = []
 
     if args.json:
-        filters.insert(0, JSONOutputFilter(sys.stdout))
+        filters.insert(0, JSONOutputFilter(binary_stdout()))
     elif args.ndjson:
-        filters.insert(0, NDJSONOutputFilter(sys.stdout))
+        filters.insert(0, NDJSONOutputFilter(binary_stdout()))
     elif not args.quiet:
         filters.insert(0, PrettyPrintFilter(sys.stdout))
 
@@ -306,10 +485,8 @@ def main():
     if args.stats:
         filters.insert(0, StatCollectionFilter())
 
-    def process_event(event):
-        for f in filters:
-            event = f.process(event)
-        
+    process_event = chain_filters(filters)
+
     # Read the protocol header, this can be read with any protocol
     contents = archive.header['user_data_header']['content']
     header = latest().decode_replay_header(contents)
@@ -325,6 +502,28 @@ def main():
               file=sys.stderr)
         sys.exit(1)
 
+    # Nothing observes the decoded data without filters, so stop once the
+    # header checks out and the requested sections are present, unless the
+    # decode itself is being profiled
+    if not filters and not args.profile:
+        requested_contents = [
+            (args.all or args.metadata, 'replay.gamemetadata.json'),
+            (args.all or args.details, 'replay.details'),
+            (args.all or args.details_backup, 'replay.details.backup'),
+            (args.all or args.initdata, 'replay.initData'),
+            (args.all or args.gameevents, 'replay.game.events'),
+            (args.all or args.messageevents, 'replay.message.events'),
+            ((args.all or args.trackerevents) and
+             hasattr(protocol, 'decode_replay_tracker_events'),
+             'replay.tracker.events'),
+            (args.all or args.attributeevents or args.attributeparse,
+             'replay.attributes.events'),
+        ]
+        for requested, content in requested_contents:
+            if requested:
+                check_contents(archive, content)
+        return
+
     # Process game metadata
     if args.all or args.metadata:
         contents = read_contents(archive, 'replay.gamemetadata.json')
@@ -354,18 +553,18 @@ def main():
     # Print game events and/or game events stats
     if args.all or args.gameevents:
         contents = read_contents(archive, 'replay.game.events')
-        map(process_event, protocol.decode_replay_game_events(contents))
+        drain_events(protocol.decode_replay_game_events(contents), process_event)
 
     # Print message events
     if args.all or args.messageevents:
         contents = read_contents(archive, 'replay.message.events')
-        map(process_event, protocol.decode_replay_message_events(contents))
+        drain_events(protocol.decode_replay_message_events(contents), process_event)
 
     # Print tracker events
     if args.all or args.trackerevents:
         if hasattr(protocol, 'decode_replay_tracker_events'):
             contents = read_contents(archive, 'replay.tracker.events')
-            map(process_event, protocol.decode_replay_tracker_events(contents))
+            drain_events(protocol.decode_replay_tracker_events(contents), process_event)
 
     # Print attributes events
     if args.all or args.attributeevents or args.attributeparse:
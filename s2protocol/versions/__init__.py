@@ -5,6 +5,16 @@ import imp
 import sys
 
 
+# Protocol module file names, capturing the build version
+_PROTOCOL_RE = re.compile(r'^protocol([0-9]+)\.py$')
+
+# Protocol modules already resolved by build(), keyed on build version
+_BUILD_CACHE = {}
+
+# Protocol module resolved by latest(), looked up on first use
+_latest_protocol = None
+
+
 def _import_protocol(base_path, protocol_module_name):
     """
     Import a module from a base path, used to import protocol modules.
@@ -44,10 +54,22 @@ def list_all(base_path=None):
     return files
 
 
+def list_builds(base_path=None):
+    """
+    Returns a list of the build versions of the current protocols in the versions module sorted by build.
+    """
+    return [int(m.group(1))
+            for m in map(_PROTOCOL_RE.match, list_all(base_path)) if m]
+
+
 def latest():
     """
     Import the latest protocol version in the versions module (directory)
     """
+    global _latest_protocol
+    if _latest_protocol is not None:
+        return _latest_protocol
+
     # Find matchng protocol version files
     base_path = os.path.dirname(__file__)
     files = list_all(base_path)
@@ -59,7 +81,8 @@ def latest():
     module_name = latest_version.split('.')[0]
 
     # Perform the import
-    return _import_protocol(base_path, module_name)
+    _latest_protocol = _import_protocol(base_path, module_name)
+    return _latest_protocol
 
 
 
@@ -67,6 +90,23 @@ def build(build_version):
     """
     Get the module for a specific build version
     """
+    try:
+        return _BUILD_CACHE[build_version]
+    except KeyError:
+        pass
+
     base_path = os.path.dirname(__file__)
-    return _import_protocol(base_path, 'protocol{0:05d}'.format(build_version))
+    protocol = _import_protocol(base_path, 'protocol{0:05d}'.format(build_version))
+    _BUILD_CACHE[build_version] = protocol
+    return protocol
+
 
+def prewarm(build_versions=None):
+    """
+    Import protocol modules ahead of time so later build() calls are lookups.
+    Every protocol in the versions module is imported when none are given.
+    """
+    if build_versions is None:
+        build_versions = list_builds()
+    for build_version in build_versions:
+        build(build_version)
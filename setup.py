@@ -40,6 +40,7 @@ setup(
     ],
     install_requires=install_requires,
     extras_require={
+        'orjson': ['orjson; python_version >= "3.6"'],
         'tests': tests_require,
     },
     entry_points={
@@ -20,6 +20,7 @@ if __name__ == '__main__':
 import s2protocol
 import test_versions
 import test_files
+import test_cli
 
 
 def run():
@@ -36,7 +37,8 @@ def run():
 
     all_tests = [
         test_versions.suite(),
-        test_files.suite()
+        test_files.suite(),
+        test_cli.suite()
     ]
 
     if options.list:
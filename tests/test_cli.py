@@ -0,0 +1,276 @@
+import io
+import json
+import os
+import sys
+import unittest
+
+from s2protocol import s2_cli
+from s2protocol.compat import PY3, get_stream
+
+self_path = os.path.dirname(__file__)
+replay_file = os.path.join(self_path, 's2replaystatsdata',
+                           '2018_05_17_Z_Raphtor_VS_T_Tocon.SC2Replay')
+
+
+def run_main(*args):
+    """ Run the command line with args and return what it printed """
+    argv, stdout = sys.argv, sys.stdout
+    sys.argv = ['s2_cli.py'] + list(args) + [replay_file]
+    sys.stdout = get_stream()
+    try:
+        s2_cli.main()
+        return sys.stdout.getvalue()
+    finally:
+        sys.argv, sys.stdout = argv, stdout
+
+
+class CollectFilter(s2_cli.EventFilter):
+    def __init__(self):
+        self.events = []
+
+    def process(self, event):
+        self.events.append(event)
+        return event
+
+
+class JSONOutputTestCase(unittest.TestCase):
+    # Not valid UTF-8, like m_ngdpRootKey and cache handle data
+    event = {'m_data': b'\x94Yj', 'm_list': [b'\xc9+']}
+    decoded = {'m_data': u'\x94Yj', 'm_list': [u'\xc9+']}
+
+    def test_json_dump(self):
+        self.assertEqual(json.loads(s2_cli.json_dump(self.event)), self.decoded)
+        self.assertEqual(json.loads(s2_cli.json_dump(self.event, indent=4)),
+                         self.decoded)
+
+    def test_json_filter(self):
+        output = io.BytesIO()
+        s2_cli.JSONOutputFilter(output).process(self.event)
+        self.assertEqual(json.loads(output.getvalue().decode('utf-8')),
+                         self.decoded)
+
+    def test_ndjson_filter(self):
+        output = io.BytesIO()
+        s2_cli.NDJSONOutputFilter(output).process(self.event)
+        self.assertEqual(json.loads(output.getvalue().decode('utf-8')),
+                         self.decoded)
+
+    def test_text_streams(self):
+        for output in [io.StringIO(),
+                       io.TextIOWrapper(io.BytesIO(), encoding='utf-8')]:
+            s2_cli.JSONOutputFilter(output).process(self.event)
+            s2_cli.NDJSONOutputFilter(output).process(self.event)
+            output.seek(0)
+            text = output.read()
+            end = text.index('}\n') + 2
+            self.assertEqual(json.loads(text[:end]), self.decoded)
+            self.assertEqual(json.loads(text[end:]), self.decoded)
+
+    def test_pretty_print_text_stream(self):
+        output = get_stream()
+        s2_cli.PrettyPrintFilter(output).process({'a': 1})
+        self.assertEqual(output.getvalue(), "{'a': 1}\n")
+
+    def test_ndjson_format(self):
+        output = io.BytesIO()
+        s2_cli.NDJSONOutputFilter(output).process({1: [b'\xc9+', 2]})
+        self.assertEqual(output.getvalue(), b'{"1":["\xc3\x89+",2]}\n')
+
+    @unittest.skipIf(s2_cli.orjson is None, 'orjson is not installed')
+    def test_ndjson_orjson_fallback(self):
+        output = io.BytesIO()
+        ndjson = s2_cli.NDJSONOutputFilter(output)
+        # orjson only handles 64 bit integers, json takes over for this one
+        ndjson.process({'m_data': b'\xc9+', 'm_seed': 1 << 70})
+        ndjson.process({'m_data': b'\xc9+', 'm_seed': 1 << 60})
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines, [
+            b'{"m_data":"\xc3\x89+","m_seed":1180591620717411303424}',
+            b'{"m_data":"\xc3\x89+","m_seed":1152921504606846976}',
+        ])
+
+    @unittest.skipIf(not PY3, 'Python2 encodes lone surrogates to UTF-8')
+    def test_ndjson_lone_surrogate(self):
+        output = io.BytesIO()
+        ndjson = s2_cli.NDJSONOutputFilter(output)
+        ndjson.process(json.loads('{"a":"\\ud800","b":"\\u00e9"}'))
+        ndjson.process({'b': u'\xe9'})
+        self.assertEqual(output.getvalue().splitlines(), [
+            b'{"a":"\\ud800","b":"\\u00e9"}',
+            b'{"b":"\xc3\xa9"}',
+        ])
+
+
+class TTYBuffer(io.BytesIO):
+    flushes = 0
+
+    def isatty(self):
+        return True
+
+    def flush(self):
+        self.flushes += 1
+        io.BytesIO.flush(self)
+
+
+@unittest.skipIf(not PY3, 'Python2 stdout already takes bytes')
+class BinaryStdoutTestCase(unittest.TestCase):
+    def test_text_stream(self):
+        # run_main swaps stdout for an io.StringIO, which has no buffer
+        lines = run_main('--header', '--ndjson').splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('m_version', json.loads(lines[0]))
+        header = json.loads(run_main('--header', '--json'))
+        self.assertIn('m_version', header)
+
+    def test_tty(self):
+        stdout = sys.stdout
+        tty = TTYBuffer()
+        # Keep the wrapper alive, collecting it closes the buffer
+        tty_stdout = io.TextIOWrapper(tty)
+        sys.stdout = tty_stdout
+        try:
+            output = s2_cli.binary_stdout()
+        finally:
+            sys.stdout = stdout
+        ndjson = s2_cli.NDJSONOutputFilter(output)
+        flushes = tty.flushes
+        ndjson.process({'a': 1})
+        self.assertEqual(tty.getvalue(), b'{"a":1}\n')
+        ndjson.process({'b': 2})
+        self.assertEqual(tty.getvalue(), b'{"a":1}\n{"b":2}\n')
+        self.assertEqual(tty.flushes, flushes + 2)
+
+
+class CacheHandleTestCase(unittest.TestCase):
+    content_hash = bytes(bytearray(range(32)))
+    content_hex = ''.join('{:02x}'.format(i) for i in range(32))
+
+    def test_cache_handle_uri(self):
+        uri = s2_cli.cache_handle_uri(b's2ma\x00\x00EU' + self.content_hash)
+        self.assertIs(type(uri), str)
+        self.assertEqual(
+            uri, 'http://eu.depot.battle.net:1119/' + self.content_hex + '.s2ma')
+
+    def test_cache_handle_uri_embedded_nul(self):
+        # Every NUL is dropped, not only the padding at either end
+        uri = s2_cli.cache_handle_uri(b'S2\x00ME\x00\x00U' + self.content_hash)
+        self.assertEqual(
+            uri, 'http://eu.depot.battle.net:1119/' + self.content_hex + '.s2m')
+
+    def test_convert_fourcc(self):
+        self.assertEqual(s2_cli.convert_fourcc('73326d61'), 's2ma')
+        self.assertEqual(s2_cli.convert_fourcc('00005553'), 'US')
+        self.assertEqual(s2_cli.convert_fourcc('55005300'), 'US')
+        self.assertIs(type(s2_cli.convert_fourcc('00005553')), str)
+
+
+class TypeDumpTestCase(unittest.TestCase):
+    def test_nested(self):
+        event = {'a': [1, {'b': b'x', 'c': [2.5, None]}], 'd': {'e': True}}
+        result = s2_cli.TypeDumpFilter().process(event)
+        self.assertEqual(result, {
+            'a': [('int', 1), {'b': (type(b'x').__name__, b'x'),
+                               'c': [('float', 2.5), ('NoneType', None)]}],
+            'd': {'e': ('bool', True)},
+        })
+        # The input event is left untouched
+        self.assertEqual(event['a'][1]['c'], [2.5, None])
+
+    @unittest.skipIf(not PY3, 'dict order is arbitrary on Python2')
+    def test_ordering(self):
+        event = dict((str(i), i) for i in range(20))
+        event['list'] = list(range(20))
+        result = s2_cli.TypeDumpFilter().process(event)
+        self.assertEqual(list(result), list(event))
+        self.assertEqual(result['list'], [('int', i) for i in range(20)])
+
+    def test_scalar(self):
+        self.assertEqual(s2_cli.TypeDumpFilter().process(3), ('int', 3))
+
+    def test_subclasses(self):
+        class EventDict(dict):
+            pass
+
+        class EventList(list):
+            pass
+
+        result = s2_cli.TypeDumpFilter().process(
+            EventDict(a=EventList([1, EventDict(b=2)])))
+        self.assertEqual(result, {'a': [('int', 1), {'b': ('int', 2)}]})
+        self.assertIs(type(result), dict)
+        self.assertIs(type(result['a']), list)
+
+
+class TagFilter(s2_cli.EventFilter):
+    def __init__(self, tag):
+        self.tag = tag
+
+    def process(self, event):
+        return event + [self.tag]
+
+
+class ChainFiltersTestCase(unittest.TestCase):
+    def test_order(self):
+        for count in range(6):
+            tags = list(range(count))
+            process_event = s2_cli.chain_filters([TagFilter(t) for t in tags])
+            self.assertEqual(process_event([]), tags)
+
+    def test_returns_event(self):
+        event = {'a': 1}
+        self.assertIs(s2_cli.chain_filters([])(event), event)
+        self.assertIs(s2_cli.chain_filters([s2_cli.EventFilter()] * 4)(event),
+                      event)
+
+
+class DrainEventsTestCase(unittest.TestCase):
+    def test_drain_events(self):
+        collect = CollectFilter()
+        s2_cli.drain_events(iter([{'a': 1}, {'b': 2}]), collect.process)
+        self.assertEqual(collect.events, [{'a': 1}, {'b': 2}])
+
+    def test_main_streams(self):
+        for option, prefix in [('--gameevents', 'NNet.Game.'),
+                               ('--messageevents', 'NNet.Game.'),
+                               ('--trackerevents', 'NNet.Replay.Tracker.')]:
+            output = run_main(option, '--stats', '--quiet')
+            rows = output.splitlines()[1:]
+            self.assertTrue(rows, option)
+            for row in rows:
+                self.assertTrue(row.startswith('"' + prefix), row)
+
+
+class QuietTestCase(unittest.TestCase):
+    def test_quiet_skips_decode(self):
+        self.assertEqual(run_main('--all', '--quiet'), '')
+
+    def test_quiet_missing_contents(self):
+        archive_cls = s2_cli.MPQArchive
+
+        class MissingGameEvents(archive_cls):
+            def get_hash_table_entry(self, filename):
+                if filename == 'replay.game.events':
+                    return None
+                return archive_cls.get_hash_table_entry(self, filename)
+
+        s2_cli.MPQArchive = MissingGameEvents
+        try:
+            self.assertEqual(run_main('--details', '--quiet'), '')
+            with self.assertRaises(SystemExit) as raised:
+                run_main('--all', '--quiet')
+        finally:
+            s2_cli.MPQArchive = archive_cls
+        self.assertEqual(raised.exception.code, 1)
+
+
+def suite():
+    loader = unittest.TestLoader()
+    return unittest.TestSuite([
+        loader.loadTestsFromTestCase(JSONOutputTestCase),
+        loader.loadTestsFromTestCase(BinaryStdoutTestCase),
+        loader.loadTestsFromTestCase(CacheHandleTestCase),
+        loader.loadTestsFromTestCase(TypeDumpTestCase),
+        loader.loadTestsFromTestCase(ChainFiltersTestCase),
+        loader.loadTestsFromTestCase(DrainEventsTestCase),
+        loader.loadTestsFromTestCase(QuietTestCase),
+    ])
@@ -10,6 +10,20 @@ class VersionsTestCase(unittest.TestCase):
         p = _versions.build(58400)
         self.assertIsNotNone(p)
 
+    def test_cached(self):
+        self.assertIs(_versions.build(58400), _versions.build(58400))
+        self.assertIs(_versions.latest(), _versions.latest())
+
+    def test_list_builds(self):
+        builds = _versions.list_builds()
+        self.assertIn(58400, builds)
+        self.assertEqual(builds, sorted(builds))
+        self.assertEqual(len(builds), len(_versions.list_all()))
+
+    def test_prewarm(self):
+        _versions.prewarm([58400])
+        self.assertIn(58400, _versions._BUILD_CACHE)
+
     def test_missing(self):
         self.assertRaises(ImportError, lambda: _versions.build(42))
 